@@ -1,15 +1,22 @@
-import requests
-from bs4 import BeautifulSoup
+import aiohttp
+import asyncio
+from bs4 import BeautifulSoup, UnicodeDammit
 import os
 import time
 from urllib.parse import urlparse, urljoin, quote, unquote, parse_qs
 import pdfkit
 import logging
 import re
+import math
+import json
 import hashlib
+import sqlite3
 import concurrent.futures
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+from html import escape
 from threading import Lock
-import queue
 
 # 设置日志
 logging.basicConfig(
@@ -19,92 +26,385 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 用于在HTML中定位<head>标签以插入<base>
+_HEAD_TAG_RE = re.compile(r'<head(?:\s[^>]*)?>', re.IGNORECASE)
+# 生成文件名时使用的正则：页面扩展名、文件名中的非法字符
+_EXT_RE = re.compile(r'\.(html|php|jsp|asp|aspx)$')
+_UNSAFE_RE = re.compile(r'[<>:"/\\|?*\s]')
+# 所有ASCII字符均视为安全字符，quote时只对非ASCII字符编码
+_ASCII_SAFE = ''.join(map(chr, range(128)))
+
+def digest128(text):
+    """计算字符串的128位哈希（整数），用作去重键"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest(), 'little')
+
+class DigestSet:
+    """精确去重集合：只保存128位哈希而非完整字符串，内存占用约为原来的一半"""
+    
+    def __init__(self):
+        self.digests = set()
+    
+    def __contains__(self, item):
+        return digest128(item) in self.digests
+    
+    def __len__(self):
+        return len(self.digests)
+    
+    def add(self, item):
+        """添加元素；若元素已存在则返回False"""
+        key = digest128(item)
+        if key in self.digests:
+            return False
+        self.digests.add(key)
+        return True
+
+class BloomFilter:
+    """可扩展的布隆过滤器，用于海量URL去重（极小概率将新URL误判为已访问）"""
+    
+    def __init__(self, initial_capacity=100000, error_rate=1e-5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.count = 0
+        # 每层为 [位数组, 位数, 哈希次数, 容量, 已添加数]
+        self.layers = []
+        self._add_layer()
+    
+    def _add_layer(self):
+        """容量用尽时追加新层：容量翻倍、误判率减半，总误判率不超过error_rate"""
+        n = len(self.layers)
+        capacity = self.initial_capacity * (2 ** n)
+        error_rate = self.error_rate * (0.5 ** (n + 1))
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        self.layers.append([bytearray((num_bits + 7) // 8), num_bits, num_hashes, capacity, 0])
+    
+    @staticmethod
+    def _hash_pair(item):
+        """一次哈希得到两个64位值，按 h1 + i*h2 派生k个位置（Kirsch-Mitzenmacher）"""
+        digest = digest128(item)
+        return digest & 0xFFFFFFFFFFFFFFFF, (digest >> 64) | 1
+    
+    @staticmethod
+    def _in_layer(layer, h1, h2):
+        bits, num_bits, num_hashes = layer[0], layer[1], layer[2]
+        for i in range(num_hashes):
+            pos = (h1 + i * h2) % num_bits
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+    
+    def __contains__(self, item):
+        h1, h2 = self._hash_pair(item)
+        return any(self._in_layer(layer, h1, h2) for layer in self.layers)
+    
+    def __len__(self):
+        return self.count
+    
+    def add(self, item):
+        """添加元素；若元素（可能）已存在则返回False"""
+        h1, h2 = self._hash_pair(item)
+        if any(self._in_layer(layer, h1, h2) for layer in self.layers):
+            return False
+        
+        layer = self.layers[-1]
+        if layer[4] >= layer[3]:
+            self._add_layer()
+            layer = self.layers[-1]
+        
+        bits, num_bits, num_hashes = layer[0], layer[1], layer[2]
+        for i in range(num_hashes):
+            pos = (h1 + i * h2) % num_bits
+            bits[pos >> 3] |= 1 << (pos & 7)
+        layer[4] += 1
+        self.count += 1
+        return True
+
+class RateLimiter:
+    """按域名限速：同一域名的相邻两次请求至少间隔min_interval秒"""
+    
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self.next_slot = {}
+    
+    async def acquire(self, host):
+        """预约该域名的下一个请求时间点并等待到达（只在事件循环线程中调用，无需加锁）"""
+        now = time.monotonic()
+        slot = max(now, self.next_slot.get(host, 0))
+        self.next_slot[host] = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+@dataclass(frozen=True, slots=True)
+class URLInfo:
+    """URL的解析结果，每个URL只解析一次并在爬取流程中传递"""
+    url: str
+    netloc: str
+    path: str   # 已解码的路径
+    query: str  # 已解码的查询参数
+
+@dataclass(frozen=True, slots=True)
+class CachedPage:
+    """上次爬取时记录的页面信息"""
+    etag: str
+    last_modified: str
+    content_sha: str
+    links: list
+    pdf_path: str
+
+class PageCache:
+    """用SQLite持久化页面缓存，重复爬取时通过条件请求跳过未变化的页面"""
+    
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, content_sha TEXT, links TEXT, pdf_path TEXT)"
+        )
+        self.conn.commit()
+    
+    def get(self, url):
+        """返回页面的缓存记录；对应的PDF已不存在时视为无缓存"""
+        row = self.conn.execute(
+            "SELECT etag, last_modified, content_sha, links, pdf_path FROM pages WHERE url = ?", (url,)
+        ).fetchone()
+        if row is None or not os.path.exists(row[4]):
+            return None
+        return CachedPage(row[0], row[1], row[2], json.loads(row[3]), row[4])
+    
+    def put(self, url, etag, last_modified, content_sha, links, pdf_path):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+            (url, etag, last_modified, content_sha, json.dumps(links), pdf_path)
+        )
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.close()
+
+@lru_cache(maxsize=8192)
+def parse_url(url):
+    """解析URL；同一链接常被多个页面引用，结果缓存避免重复解析"""
+    parsed = urlparse(url)
+    return URLInfo(url=url, netloc=parsed.netloc, path=unquote(parsed.path), query=unquote(parsed.query))
+
+def extract_links(markup, base_url):
+    """解析HTML并返回页面中去重后的绝对链接"""
+    soup = BeautifulSoup(markup, 'lxml')
+    # 同一页面中重复出现的链接只处理一次（dict保持出现顺序）
+    hrefs = dict.fromkeys(a_tag['href'] for a_tag in soup.find_all('a', href=True))
+    links = {}
+    
+    for link in hrefs:
+        # 处理可能含有中文字符的URL
+        try:
+            link = unquote(link)  # 先解码，防止重复编码
+            # 只对非ASCII字符进行编码
+            link = quote(link, safe=_ASCII_SAFE)
+        except Exception as e:
+            logger.warning(f"URL编码处理异常: {link}, 错误: {str(e)}")
+        
+        link = urljoin(base_url, link)
+        
+        # 排除锚点链接
+        if '#' in link:
+            link = link.split('#')[0]
+        
+        if link:
+            links[link] = None
+    
+    return list(links)
+
+def parse_page(html, base_url, encoding=None, with_links=True):
+    """解码已下载的HTML，返回 (供wkhtmltopdf使用的HTML, 页面链接)（CPU密集型，在进程池中执行）"""
+    # 只解码一次，链接提取与PDF转换共用；若响应头给出了编码则优先使用
+    markup = UnicodeDammit(html, [encoding] if encoding else [], is_html=True).unicode_markup
+    if markup is None:
+        markup = html.decode('utf-8', errors='replace')
+    
+    links = extract_links(markup, base_url) if with_links else []
+    
+    # HTML通过stdin传给wkhtmltopdf，插入<base>使相对路径的样式和图片仍能正确加载；
+    # 内容已解码为字符串，并声明为UTF-8与pdfkit写入stdin的编码一致
+    base_tags = f'<base href="{escape(base_url)}"><meta charset="utf-8">'
+    head = _HEAD_TAG_RE.search(markup)
+    if head:
+        markup = markup[:head.end()] + base_tags + markup[head.end():]
+    else:
+        markup = base_tags + markup
+    
+    return markup, links
+
+@lru_cache(maxsize=None)
+def _pdfkit_config(wkhtmltopdf_path):
+    """每个转换进程只创建一次pdfkit配置"""
+    return pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
+
+def render_pdf(pages, pdf_path, options, wkhtmltopdf_path):
+    """调用wkhtmltopdf将HTML渲染为PDF（在独立进程中执行）；多个页面合并为一个PDF"""
+    config = _pdfkit_config(wkhtmltopdf_path)
+    if len(pages) == 1:
+        pdfkit.from_string(pages[0], pdf_path, options=options, configuration=config)
+        return
+    
+    # stdin只能传入一个页面，多个页面先写入临时文件再一并交给wkhtmltopdf
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        html_files = []
+        for i, html in enumerate(pages):
+            html_file = os.path.join(tmp_dir, f"{i}.html")
+            with open(html_file, 'w', encoding='utf-8') as f:
+                f.write(html)
+            html_files.append(html_file)
+        
+        options = dict(options, **{'enable-local-file-access': None})
+        pdfkit.from_file(html_files, pdf_path, options=options, configuration=config)
+
 class WebCrawler:
-    def __init__(self, start_url, max_depth=3, delay=1, output_folder="crawled_pdfs", max_workers=10):
-        self.start_url = start_url
+    def __init__(self, start_url, max_depth=3, delay=1, output_folder="crawled_pdfs", max_workers=10, pdf_batch_size=1, use_bloom_filter=False, cache_file="crawl_cache.db"):
+        self.start_url = parse_url(start_url)
         self.max_depth = max_depth
         self.delay = delay
         self.output_folder = output_folder
         self.max_workers = max_workers
+        # 每次调用wkhtmltopdf渲染的页面数；大于1时同一批页面合并为一个PDF
+        self.pdf_batch_size = max(1, pdf_batch_size)
         
-        # 使用线程安全的集合和锁
-        self.visited_urls = set()
-        self.visited_lock = Lock()
-        self.url_queue = queue.Queue()
+        # 已访问URL默认按128位哈希精确去重；超大规模爬取可改用布隆过滤器进一步节省内存
+        if use_bloom_filter:
+            self.visited_filter = BloomFilter(initial_capacity=100000, error_rate=1e-5)
+        else:
+            self.visited_filter = DigestSet()
+        self.url_queue = None
         
         # 用于跟踪已生成的文件名，避免重复
-        self.used_filenames = set()
+        self.used_filenames = DigestSet()
         self.filename_lock = Lock()
         
-        self.base_domain = urlparse(start_url).netloc
+        self.base_domain = self.start_url.netloc
+
+        # 异步HTTP会话及并发控制（在事件循环中创建），复用keep-alive连接
+        self.session = None
+        self.fetch_semaphore = None
+        
+        # 正在执行的任务数，任务结束时通过条件变量唤醒调度循环
+        self._pending = 0
+        self._cv = None
+        self.max_retries = 3
+        # 爬取任务各自限速，同一域名的相邻两次请求至少间隔delay秒
+        self.rate_limiter = RateLimiter(min_interval=self.delay)
+        
+        # 解析HTML与调用wkhtmltopdf分别使用独立的进程池，不阻塞事件循环
+        self.parse_executor = None
+        self.pdf_executor = None
+        self.pdf_workers = min(4, os.cpu_count() or 1)
+        
+        # 待转换PDF的有界队列，由PDF写入任务批量消费
+        self.pdf_queue = None
 
         # PDFKit 配置
         self.wkhtmltopdf_path = r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe'  # 修改为你的实际路径
-        self.config = pdfkit.configuration(wkhtmltopdf=self.wkhtmltopdf_path)
+        self.pdf_options = {
+            'page-size': 'A4',
+            'encoding': "UTF-8",
+            'custom-header': [
+                ('User-Agent', 'Mozilla/5.0')
+            ],
+            'no-outline': None,
+            'quiet': ''
+        }
         
         # 创建输出目录
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
+        
+        # 页面缓存保存在输出目录中，与生成的PDF对应；cache_file为None时不使用缓存
+        self.page_cache = PageCache(os.path.join(output_folder, cache_file)) if cache_file else None
             
         # 计数器
         self.processed_count = 0
-        self.processed_lock = Lock()
     
-    def is_valid_url(self, url):
+    def is_valid_url(self, url_info):
         """检查URL是否有效且属于同一域名"""
-        parsed = urlparse(url)
-        return bool(parsed.netloc) and parsed.netloc == self.base_domain
+        return bool(url_info.netloc) and url_info.netloc == self.base_domain
+    
+    async def _fetch(self, url_info, cached=None):
+        """异步获取页面，返回 (状态码, 内容, 响应头中的编码, 响应头)；有缓存时发送条件请求"""
+        url = url_info.url
+        headers = {}
+        if cached:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+        
+        await self.rate_limiter.acquire(url_info.netloc)
+        async with self.fetch_semaphore:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    async with self.session.get(url, headers=headers) as response:
+                        if response.status == 304:
+                            return 304, None, None, response.headers
+                        if response.status != 200:
+                            logger.error(f"无法获取页面 {url}，状态码: {response.status}")
+                            return response.status, None, None, response.headers
+                        return 200, await response.read(), response.charset, response.headers
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt == self.max_retries:
+                        raise
+                    # 连接失败时指数退避重试
+                    await asyncio.sleep(0.3 * (2 ** attempt))
+    
+    def _new_links(self, links):
+        """将页面链接转换为URLInfo，只保留同域名且未访问的链接"""
+        # 先完成纯计算的校验，再集中一次过滤已访问的URL
+        candidates = [info for info in map(parse_url, links) if self.is_valid_url(info)]
+        return [info for info in candidates if info.url not in self.visited_filter]
     
-    def get_page_links(self, url):
-        """获取页面中的所有链接"""
+    async def fetch_page(self, url_info, with_links=True):
+        """下载页面，返回 (待转换的页面, 页面中未访问的链接)
+        
+        待转换的页面为 (HTML, 缓存信息)；页面未变化（已有PDF）或下载失败时为None
+        """
+        url = url_info.url
         try:
-            response = requests.get(url, headers={"User-Agent": "Mozilla/5.0"}, timeout=30)
-            response.encoding = response.apparent_encoding  # 自动检测编码
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                links = []
-                
-                for a_tag in soup.find_all('a', href=True):
-                    link = a_tag['href']
-                    
-                    # 处理可能含有中文字符的URL
-                    try:
-                        link = unquote(link)  # 先解码，防止重复编码
-                        # 只对非ASCII字符进行编码
-                        link = ''.join([quote(c) if ord(c) > 127 else c for c in link])
-                    except Exception as e:
-                        logger.warning(f"URL编码处理异常: {link}, 错误: {str(e)}")
-                    
-                    link = urljoin(url, link)
-                    
-                    # 排除锚点链接
-                    if '#' in link:
-                        link = link.split('#')[0]
-                    
-                    # 使用锁检查URL是否已访问
-                    with self.visited_lock:
-                        if link and self.is_valid_url(link) and link not in self.visited_urls:
-                            links.append(link)
-                
-                return links
-            else:
-                logger.error(f"无法获取页面 {url}，状态码: {response.status_code}")
-                return []
+            cached = self.page_cache.get(url) if self.page_cache else None
+            status, html, encoding, headers = await self._fetch(url_info, cached)
+            
+            # 服务器确认页面未修改，直接使用上次记录的链接
+            if status == 304:
+                logger.info(f"页面未修改，跳过: {url}")
+                return None, self._new_links(cached.links) if with_links else []
+            if status != 200:
+                return None, []
+            
+            etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+            content_sha = hashlib.blake2b(html, digest_size=16).hexdigest()
+            
+            # 内容与上次相同，无需重新解析和生成PDF
+            if cached and cached.content_sha == content_sha:
+                logger.info(f"页面内容未变化，跳过: {url}")
+                self.page_cache.put(url, etag, last_modified, content_sha, cached.links, cached.pdf_path)
+                return None, self._new_links(cached.links) if with_links else []
+            
+            # 在进程池中解析HTML，保持事件循环响应；使用缓存时始终提取链接以便下次复用
+            loop = asyncio.get_running_loop()
+            markup, links = await loop.run_in_executor(
+                self.parse_executor, parse_page, html, url, encoding, with_links or self.page_cache is not None
+            )
+            
+            cache_info = (etag, last_modified, content_sha, links)
+            return (markup, cache_info), self._new_links(links) if with_links else []
         except Exception as e:
-            logger.error(f"获取 {url} 链接时发生错误: {str(e)}")
-            return []
+            logger.error(f"获取 {url} 时发生错误: {str(e)}")
+            return None, []
     
-    def generate_safe_filename(self, url, depth):
+    def generate_safe_filename(self, url_info, depth):
         """生成安全且唯一的文件名，保留尽可能多的URL信息"""
+        url = url_info.url
         try:
-            # 解码URL中可能的编码字符
-            decoded_url = unquote(url)
-            
-            # 解析URL各部分
-            parsed_url = urlparse(decoded_url)
-            domain = parsed_url.netloc
-            path = parsed_url.path.strip('/')
-            query = parsed_url.query
+            # 使用已解析（并解码）的URL各部分
+            domain = url_info.netloc
+            path = url_info.path.strip('/')
+            query = url_info.query
             
             # 从查询参数中提取关键信息
             query_info = ""
@@ -125,22 +425,22 @@ class WebCrawler:
                 if len(path_parts) > 3:
                     # 如果路径很长，只保留最后几个部分
                     path = '_'.join(path_parts[-3:])
-                path = re.sub(r'\.(html|php|jsp|asp|aspx)$', '', path)
+                path = _EXT_RE.sub('', path)
             
             # 创建基本文件名
             base_name = f"{domain}_{path}{query_info}_d{depth}"
             
             # 移除文件名中的非法字符
-            safe_name = re.sub(r'[<>:"/\\|?*\s]', '_', base_name)
+            safe_name = _UNSAFE_RE.sub('_', base_name)
             
             # 确保文件名不超过合理长度，但保留更多信息
             if len(safe_name) > 180:
                 # 保留域名和路径的前部分，添加哈希值确保唯一性
-                url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()[:12]
+                url_hash = hashlib.blake2b(url.encode('utf-8'), digest_size=6).hexdigest()
                 safe_name = f"{safe_name[:160]}_{url_hash}_d{depth}"
             else:
                 # 添加URL部分哈希以确保唯一性
-                url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()[:8]
+                url_hash = hashlib.blake2b(url.encode('utf-8'), digest_size=4).hexdigest()
                 safe_name = f"{safe_name}_{url_hash}"
             
             # 确保文件名唯一
@@ -158,7 +458,7 @@ class WebCrawler:
         except Exception as e:
             # 如果生成文件名出错，使用完整URL的哈希值作为文件名
             logger.warning(f"生成文件名异常，使用完整哈希: {str(e)}")
-            url_hash = hashlib.md5(url.encode('utf-8')).hexdigest()
+            url_hash = hashlib.blake2b(url.encode('utf-8'), digest_size=16).hexdigest()
             with self.filename_lock:
                 safe_name = f"page_{url_hash}_d{depth}"
                 # 确保即使哈希也不重复
@@ -170,101 +470,168 @@ class WebCrawler:
                 self.used_filenames.add(safe_name)
             return safe_name
     
-    def save_as_pdf(self, url, filename):
-        """将页面保存为PDF"""
+    async def save_as_pdf(self, batch):
+        """将一批 (url, 文件名, HTML, 缓存信息) 保存为PDF：单个页面单独保存，多个页面合并为一个PDF"""
+        urls = [url for url, _, _, _ in batch]
+        if len(batch) == 1:
+            pdf_path = os.path.join(self.output_folder, f"{batch[0][1]}.pdf")
+        else:
+            pdf_path = os.path.join(self.output_folder, f"{batch[0][1]}_batch{len(batch)}.pdf")
+        
+        loop = asyncio.get_running_loop()
+        executor = self.pdf_executor
         try:
-            options = {
-                'page-size': 'A4',
-                'encoding': "UTF-8",
-                'custom-header': [
-                    ('User-Agent', 'Mozilla/5.0')
-                ],
-                'no-outline': None,
-                'quiet': ''
-            }
+            await loop.run_in_executor(
+                executor, render_pdf,
+                [html for _, _, html, _ in batch], pdf_path, self.pdf_options, self.wkhtmltopdf_path
+            )
             
-            pdf_path = os.path.join(self.output_folder, f"{filename}.pdf")
+            # PDF生成成功后才记录缓存，保证下次跳过的页面都有对应的PDF
+            if self.page_cache:
+                for url, _, _, cache_info in batch:
+                    self.page_cache.put(url, *cache_info, pdf_path)
             
-            pdfkit.from_url(url, pdf_path, options=options, configuration=self.config)
-            logger.info(f"保存PDF成功: {pdf_path}")
+            if len(batch) == 1:
+                logger.info(f"保存PDF成功: {pdf_path}")
+            else:
+                logger.info(f"保存合并PDF成功: {pdf_path}，包含 {len(urls)} 个页面: {', '.join(urls)}")
             return True
+        except concurrent.futures.process.BrokenProcessPool as e:
+            # 转换进程意外退出时重建进程池，后续页面不受影响
+            logger.error(f"PDF转换进程异常退出 {', '.join(urls)}: {str(e)}")
+            if self.pdf_executor is executor:
+                self._reset_pdf_executor()
+            return False
         except Exception as e:
-            logger.error(f"保存PDF失败 {url}: {str(e)}")
+            logger.error(f"保存PDF失败 {', '.join(urls)}: {str(e)}")
             return False
     
-    def process_url(self, url_info):
+    def _reset_pdf_executor(self):
+        """替换已损坏的PDF进程池"""
+        broken = self.pdf_executor
+        self.pdf_executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.pdf_workers)
+        broken.shutdown(wait=False)
+    
+    async def _pdf_writer(self):
+        """从队列中取出待转换页面，每次最多合并pdf_batch_size个页面调用一次wkhtmltopdf"""
+        finished = False
+        while not finished:
+            item = await self.pdf_queue.get()
+            if item is None:
+                break
+            
+            # 队列中有积压时凑满一批，否则立即转换
+            batch = [item]
+            while len(batch) < self.pdf_batch_size:
+                try:
+                    item = self.pdf_queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+            
+            await self.save_as_pdf(batch)
+    
+    async def process_url(self, task):
         """处理单个URL的爬取任务"""
-        url, depth = url_info
+        url_info, depth = task
+        url = url_info.url
         
         # 如果超过最大深度，直接返回
         if depth > self.max_depth:
             return
         
-        # 检查URL是否已访问
-        with self.visited_lock:
-            if url in self.visited_urls:
-                return
-            self.visited_urls.add(url)
+        # 检查URL是否已访问（仅在事件循环线程中访问，无需加锁）
+        if not self.visited_filter.add(url):
+            return
         
         logger.info(f"正在爬取 ({depth}/{self.max_depth}): {url}")
         
-        # 生成安全的文件名
-        filename = self.generate_safe_filename(url, depth)
-        
-        # 保存为PDF
-        self.save_as_pdf(url, filename)
+        try:
+            # 生成安全的文件名
+            filename = self.generate_safe_filename(url_info, depth)
+            
+            # 只下载一次页面；未达到最大深度时同时提取链接
+            page, links = await self.fetch_page(url_info, with_links=depth < self.max_depth)
+            
+            if page is not None:
+                # 交给PDF写入任务转换（队列已满时等待，形成背压）
+                await self.pdf_queue.put((url, filename, *page))
+            
+            for link in links:
+                self.url_queue.put_nowait((link, depth + 1))
+        except Exception as e:
+            logger.error(f"处理 {url} 时发生错误: {str(e)}")
         
         # 更新计数器
-        with self.processed_lock:
-            self.processed_count += 1
-        
-        # 如果未达到最大深度，获取并添加链接到队列
-        if depth < self.max_depth:
-            links = self.get_page_links(url)
-            for link in links:
-                self.url_queue.put((link, depth + 1))
+        self.processed_count += 1
     
-    def crawl(self):
-        """使用线程池执行爬虫任务"""
+    async def _run_task(self, task):
+        """执行爬取任务，结束后减少待完成计数并通知调度循环"""
+        try:
+            await self.process_url(task)
+        finally:
+            async with self._cv:
+                self._pending -= 1
+                self._cv.notify_all()
+    
+    async def _crawl(self):
+        """在事件循环中调度爬虫任务"""
         # 将起始URL加入队列
-        self.url_queue.put((self.start_url, 0))
+        self.url_queue = asyncio.Queue()
+        self.url_queue.put_nowait((self.start_url, 0))
+        self.fetch_semaphore = asyncio.Semaphore(self.max_workers)
+        self._cv = asyncio.Condition()
         
-        # 创建线程池
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = []
+        # 启动与PDF转换进程数相同的写入任务
+        self.pdf_queue = asyncio.Queue(maxsize=self.pdf_workers * self.pdf_batch_size * 2)
+        writers = [asyncio.create_task(self._pdf_writer()) for _ in range(self.pdf_workers)]
+        
+        connector = aiohttp.TCPConnector(limit=self.max_workers, limit_per_host=self.max_workers, ttl_dns_cache=300)
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=30),
+            headers={"User-Agent": "Mozilla/5.0"}
+        ) as session:
+            self.session = session
+            # 事件循环只弱引用任务，需保留正在执行的任务；任务完成后自动移除
+            running = set()
             
             while True:
-                # 获取当前队列中所有URL并提交到线程池
-                current_urls = []
-                try:
-                    # 先尝试获取一个URL（这会阻塞直到有URL）
-                    current_urls.append(self.url_queue.get(timeout=1))
-                    
-                    # 尝试获取队列中剩余的所有URL（非阻塞）
-                    while True:
-                        try:
-                            current_urls.append(self.url_queue.get(block=False))
-                        except queue.Empty:
-                            break
-                except queue.Empty:
-                    # 如果队列为空且所有任务都已完成，则退出循环
-                    if all(future.done() for future in futures):
+                # 等待队列中有新URL；队列为空且没有正在执行的任务时爬取结束
+                async with self._cv:
+                    await self._cv.wait_for(lambda: self._pending == 0 or not self.url_queue.empty())
+                    if self._pending == 0 and self.url_queue.empty():
                         break
-                    continue
-                
-                # 提交任务到线程池
-                for url_info in current_urls:
-                    # 添加随机延迟，避免请求过于密集
-                    time.sleep(self.delay * (0.5 + 0.5 * (hash(url_info[0]) % 100) / 100))
-                    future = executor.submit(self.process_url, url_info)
-                    futures.append(future)
                 
-                # 清理已完成的future
-                futures = [f for f in futures if not f.done()]
+                # 为队列中所有URL创建爬取任务（请求频率由各任务在请求前自行限速，调度不再等待）
+                while not self.url_queue.empty():
+                    self._pending += 1
+                    task = asyncio.create_task(self._run_task(self.url_queue.get_nowait()))
+                    running.add(task)
+                    task.add_done_callback(running.discard)
                 
                 # 进度更新
-                with self.visited_lock:
-                    logger.info(f"进度: 已处理 {self.processed_count} 个页面, 已访问 {len(self.visited_urls)} 个URL, 队列中还有 {self.url_queue.qsize()} 个页面待处理")
+                logger.info(f"进度: 已处理 {self.processed_count} 个页面, 已访问 {len(self.visited_filter)} 个URL, 队列中还有 {self.url_queue.qsize()} 个页面待处理")
+        
+        # 爬取结束后通知写入任务退出，并等待剩余PDF转换完成
+        for _ in writers:
+            await self.pdf_queue.put(None)
+        await asyncio.gather(*writers)
+    
+    def crawl(self):
+        """使用asyncio执行爬虫任务"""
+        with concurrent.futures.ProcessPoolExecutor() as parse_executor:
+            self.parse_executor = parse_executor
+            self.pdf_executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.pdf_workers)
+            try:
+                asyncio.run(self._crawl())
+            finally:
+                self.pdf_executor.shutdown()
+                if self.page_cache:
+                    self.page_cache.close()
 
 def get_optimal_thread_count():
     """根据CPU核心数确定合适的线程数"""
@@ -297,6 +664,12 @@ if __name__ == "__main__":
             max_workers = get_optimal_thread_count()
             print(f"输入的线程数无效，使用默认值{max_workers}")
         
+        try:
+            pdf_batch_size = int(input("请输入每个PDF合并的页面数 (默认1，即每页单独保存): ") or "1")
+        except ValueError:
+            pdf_batch_size = 1
+            print("输入的页面数无效，使用默认值1")
+        
         # output_folder = input("请输入保存PDF的文件夹路径 (默认'crawled_pdfs'): ") or "crawled_pdfs"
         output_folder = "crawled_pdfs"
         
@@ -309,14 +682,15 @@ if __name__ == "__main__":
             max_depth=max_depth,
             delay=delay,
             output_folder=output_folder,
-            max_workers=max_workers
+            max_workers=max_workers,
+            pdf_batch_size=pdf_batch_size
         )
         crawler.crawl()
         
         end_time = time.time()
         duration = end_time - start_time
         
-        logger.info(f"爬取完成。共爬取 {len(crawler.visited_urls)} 个页面，用时 {duration:.2f} 秒。")
+        logger.info(f"爬取完成。共爬取 {len(crawler.visited_filter)} 个页面，用时 {duration:.2f} 秒。")
         logger.info(f"PDF文件保存在目录: {os.path.abspath(crawler.output_folder)}")
         
     except KeyboardInterrupt:
@@ -4,20 +4,61 @@ import pdfkit
 import urllib.parse
 from urllib.parse import urljoin, urlparse
 import requests
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from lxml import etree
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Event
+
+# Windows文件名中不允许的字符，一次translate全部替换为下划线
+_INVALID_CHARS_TABLE = str.maketrans({c: '_' for c in r'<>:"/\|?*'})
+
+def iter_hrefs(response):
+    """边下载边解析，逐个产出页面中<a>标签的href，已处理的节点随即释放
+    
+    按response.encoding增量解码后再交给解析器，无法解码的字节替换为U+FFFD，不会截断之后的内容
+    """
+    parser = etree.HTMLPullParser(events=('end',))
+    
+    def drain():
+        for _, element in parser.read_events():
+            if element.tag == 'a':
+                href = element.get('href')
+                if href:
+                    yield href
+            # 释放已解析完的节点，内存占用与页面大小无关
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    
+    for chunk in response.iter_content(chunk_size=16384, decode_unicode=True):
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
 
 class WebsiteCrawler:
-    def __init__(self, start_url, max_depth=3, output_dir='pdf_output'):
+    def __init__(self, start_url, max_depth=3, output_dir='pdf_output', max_workers=5):
         self.start_url = start_url
         self.max_depth = max_depth
         self.output_dir = output_dir
+        self.max_workers = max_workers
         self.visited_urls = set()
+        self.visited_lock = Lock()
+        
+        # 全局线程池及未完成任务计数，计数归零即表示爬取结束
+        self.executor = None
+        self.pending_tasks = 0
+        self.pending_lock = Lock()
+        self.all_done = Event()
         self.domain = urlparse(start_url).netloc
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        # 连接池大小与线程数保持一致，避免并发时连接被丢弃重建
+        adapter = HTTPAdapter(pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         
         # PDFKit 配置
         self.wkhtmltopdf_path = r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe'  # 修改为你的实际路径
@@ -34,16 +75,14 @@ class WebsiteCrawler:
     def get_links(self, url):
         """获取页面中的所有有效链接"""
         try:
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
             links = set()
-            for a_tag in soup.find_all('a', href=True):
-                href = a_tag['href']
-                full_url = urljoin(url, href)
-                if self.is_valid_url(full_url):
-                    links.add(full_url)
+            # 流式下载，解析与网络读取同时进行
+            with self.session.get(url, timeout=10, stream=True) as response:
+                response.raise_for_status()
+                for href in iter_hrefs(response):
+                    full_url = urljoin(url, href)
+                    if self.is_valid_url(full_url):
+                        links.add(full_url)
             return links
         except Exception as e:
             print(f"Error getting links from {url}: {e}")
@@ -76,9 +115,7 @@ class WebsiteCrawler:
                 filename = f"{parsed_url.netloc}_{path_part}.pdf"
             
             # 进一步清理文件名（替换Windows不允许的字符）
-            invalid_chars = r'<>:"/\|?*'
-            for char in invalid_chars:
-                filename = filename.replace(char, '_')
+            filename = filename.translate(_INVALID_CHARS_TABLE)
             
             # 限制文件名长度
             filename = filename[:200] + '.pdf' if len(filename) > 200 else filename
@@ -93,34 +130,43 @@ class WebsiteCrawler:
             print(f"Error saving {url} as PDF: {e}")
             return False
     
-    def crawl(self, url, depth=1):
-        """递归爬取网页"""
-        if depth > self.max_depth or url in self.visited_urls:
-            return
-        
-        self.visited_urls.add(url)
-        print(f"Crawling: {url} (Depth: {depth})")
-        
-        # 保存当前页面为PDF
-        self.save_as_pdf(url)
-        
-        # 获取并处理子链接
-        if depth < self.max_depth:
-            links = self.get_links(url)
+    def _submit(self, url, depth):
+        """将页面提交到全局线程池"""
+        with self.pending_lock:
+            self.pending_tasks += 1
+        self.executor.submit(self.process_url, url, depth)
+    
+    def process_url(self, url, depth):
+        """爬取单个页面，并将新发现的链接提交到线程池"""
+        try:
+            with self.visited_lock:
+                if depth > self.max_depth or url in self.visited_urls:
+                    return
+                self.visited_urls.add(url)
+            print(f"Crawling: {url} (Depth: {depth})")
+            
+            # 保存当前页面为PDF
+            self.save_as_pdf(url)
             
-            # 使用线程池并行处理
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                futures = []
-                for link in links:
+            # 获取子链接并加入待爬取队列
+            if depth < self.max_depth:
+                for link in self.get_links(url):
                     if link not in self.visited_urls:
-                        futures.append(executor.submit(self.crawl, link, depth + 1))
-                
-                for future in as_completed(futures):
-                    future.result()  # 等待所有任务完成
+                        self._submit(link, depth + 1)
+        except Exception as e:
+            print(f"Error crawling {url}: {e}")
+        finally:
+            with self.pending_lock:
+                self.pending_tasks -= 1
+                if self.pending_tasks == 0:
+                    self.all_done.set()
     
     def start(self):
         """开始爬取"""
-        self.crawl(self.start_url)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self.executor = executor
+            self._submit(self.start_url, 1)
+            self.all_done.wait()
         print(f"\nCrawling completed. Total pages saved: {len(self.visited_urls)}")
 
 if __name__ == "__main__":
@@ -3,21 +3,68 @@ import time
 import pdfkit
 from urllib.parse import urljoin, urlparse, unquote, quote
 import requests
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from lxml import etree
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Event
+
+# 文件名字符替换表：URL分隔符与Windows不允许的字符，一次translate全部处理
+_FILENAME_TABLE = str.maketrans({
+    '/': '_',
+    '?': '_',
+    '=': '_eq_',
+    '&': '_and_',
+    **{c: '_' for c in r'<>:"\|*'}
+})
+
+def iter_hrefs(response):
+    """边下载边解析，逐个产出页面中<a>标签的href，已处理的节点随即释放
+    
+    按response.encoding增量解码后再交给解析器，无法解码的字节替换为U+FFFD，不会截断之后的内容
+    """
+    parser = etree.HTMLPullParser(events=('end',))
+    
+    def drain():
+        for _, element in parser.read_events():
+            if element.tag == 'a':
+                href = element.get('href')
+                if href:
+                    yield href
+            # 释放已解析完的节点，内存占用与页面大小无关
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    
+    for chunk in response.iter_content(chunk_size=16384, decode_unicode=True):
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
 
 class WebsiteCrawler:
-    def __init__(self, start_url, max_depth=3, output_dir='pdf_output'):
+    def __init__(self, start_url, max_depth=3, output_dir='pdf_output', max_workers=5):
         # 初始化时解码start_url中的中文（如果有）
         self.start_url = self._normalize_url(start_url)
         self.max_depth = max_depth
         self.output_dir = output_dir
+        self.max_workers = max_workers
         self.visited_urls = set()
+        self.visited_lock = Lock()
+        
+        # 全局线程池及未完成任务计数，计数归零即表示爬取结束
+        self.executor = None
+        self.pending_tasks = 0
+        self.pending_lock = Lock()
+        self.all_done = Event()
         self.domain = urlparse(self.start_url).netloc
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        # 连接池大小与线程数保持一致，避免并发时连接被丢弃重建
+        adapter = HTTPAdapter(pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         
         # PDFKit配置
         self.wkhtmltopdf_path = r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe'
@@ -25,9 +72,8 @@ class WebsiteCrawler:
         
         os.makedirs(self.output_dir, exist_ok=True)
     
-    def _normalize_url(self, url):
-        """统一URL格式，处理中文编码问题"""
-        parsed = urlparse(url)
+    def _normalize_parsed(self, parsed):
+        """统一已解析URL的格式，处理中文编码问题"""
         # 解码路径和查询参数中的中文
         path = unquote(parsed.path)
         query = unquote(parsed.query)
@@ -37,48 +83,49 @@ class WebsiteCrawler:
         # 重构URL
         return parsed._replace(path=path, query=query).geturl()
     
-    def is_valid_url(self, url):
-        """检查URL是否有效且属于同一域名"""
+    def _normalize_url(self, url):
+        """统一URL格式，处理中文编码问题"""
+        return self._normalize_parsed(urlparse(url))
+    
+    def _parse_and_validate(self, url):
+        """解析URL，属于同一域名的http(s)链接返回标准化后的URL，否则返回None"""
         try:
-            parsed = urlparse(self._normalize_url(url))
-            return bool(parsed.netloc) and parsed.netloc == self.domain and parsed.scheme in ['http', 'https']
-        except:
-            return False
+            parsed = urlparse(url)
+        except ValueError:
+            return None
+        # 标准化不会改变协议和域名，先校验，站外链接无需再做编码处理
+        if not parsed.netloc or parsed.netloc != self.domain or parsed.scheme not in ('http', 'https'):
+            return None
+        return self._normalize_parsed(parsed)
     
-    def get_links(self, url):
-        """获取页面中的所有有效链接，正确处理中文"""
+    def get_links(self, normalized_url):
+        """获取页面中的所有有效链接（传入及返回的URL均已标准化）"""
         try:
-            normalized_url = self._normalize_url(url)
-            response = self.session.get(normalized_url, timeout=10)
-            response.raise_for_status()
-            
-            # 设置正确的编码（根据网页实际编码调整）
-            if response.encoding.lower() not in ('utf-8', 'gbk', 'gb2312'):
-                response.encoding = 'utf-8'
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
             links = set()
-            for a_tag in soup.find_all('a', href=True):
-                href = a_tag['href']
-                try:
-                    # 处理相对路径和绝对路径
-                    full_url = urljoin(normalized_url, href)
-                    # 标准化URL（处理中文）
-                    full_url = self._normalize_url(full_url)
-                    if self.is_valid_url(full_url):
-                        links.add(full_url)
-                except Exception as e:
-                    print(f"Error processing link {href}: {e}")
+            # 流式下载，解析与网络读取同时进行
+            with self.session.get(normalized_url, timeout=10, stream=True) as response:
+                response.raise_for_status()
+                
+                # 设置正确的编码（根据网页实际编码调整）
+                if response.encoding.lower() not in ('utf-8', 'gbk', 'gb2312'):
+                    response.encoding = 'utf-8'
+                
+                for href in iter_hrefs(response):
+                    try:
+                        # 处理相对路径和绝对路径，校验后标准化URL（处理中文）
+                        full_url = self._parse_and_validate(urljoin(normalized_url, href))
+                        if full_url:
+                            links.add(full_url)
+                    except Exception as e:
+                        print(f"Error processing link {href}: {e}")
             return links
         except Exception as e:
-            print(f"Error getting links from {url}: {e}")
+            print(f"Error getting links from {normalized_url}: {e}")
             return set()
     
-    def save_as_pdf(self, url):
-        """将网页保存为PDF，正确处理中文URL"""
+    def save_as_pdf(self, normalized_url):
+        """将网页保存为PDF，正确处理中文URL（传入的URL已标准化）"""
         try:
-            normalized_url = self._normalize_url(url)
             parsed_url = urlparse(normalized_url)
             
             # 创建文件名（保留中文可读性）
@@ -90,18 +137,8 @@ class WebsiteCrawler:
                 query = unquote(parsed_url.query)
                 filename += f"_{query}"
             
-            # 替换特殊字符
-            filename = (
-                filename.replace('/', '_')
-                .replace('?', '_')
-                .replace('=', '_eq_')
-                .replace('&', '_and_')
-            )
-            
-            # 进一步清理文件名
-            invalid_chars = r'<>:"\|*'
-            for char in invalid_chars:
-                filename = filename.replace(char, '_')
+            # 替换特殊字符并清理文件名
+            filename = filename.translate(_FILENAME_TABLE)
             
             # 限制长度并添加扩展名
             filename = filename[:200] + '.pdf' if len(filename) > 200 else filename + '.pdf'
@@ -112,38 +149,46 @@ class WebsiteCrawler:
             print(f"Saved: {normalized_url} as {filepath}")
             return True
         except Exception as e:
-            print(f"Error saving {url} as PDF: {e}")
+            print(f"Error saving {normalized_url} as PDF: {e}")
             return False
     
-    def crawl(self, url, depth=1):
-        """递归爬取网页，正确处理中文URL"""
-        normalized_url = self._normalize_url(url)
-        
-        if depth > self.max_depth or normalized_url in self.visited_urls:
-            return
-        
-        self.visited_urls.add(normalized_url)
-        print(f"Crawling: {normalized_url} (Depth: {depth})")
-        
-        # 保存当前页面为PDF
-        self.save_as_pdf(normalized_url)
-        
-        # 获取并处理子链接
-        if depth < self.max_depth:
-            links = self.get_links(normalized_url)
+    def _submit(self, url, depth):
+        """将页面提交到全局线程池"""
+        with self.pending_lock:
+            self.pending_tasks += 1
+        self.executor.submit(self.process_url, url, depth)
+    
+    def process_url(self, normalized_url, depth):
+        """爬取单个页面（URL已标准化），并将新发现的链接提交到线程池"""
+        try:
+            with self.visited_lock:
+                if depth > self.max_depth or normalized_url in self.visited_urls:
+                    return
+                self.visited_urls.add(normalized_url)
+            print(f"Crawling: {normalized_url} (Depth: {depth})")
             
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                futures = []
-                for link in links:
+            # 保存当前页面为PDF
+            self.save_as_pdf(normalized_url)
+            
+            # 获取子链接并加入待爬取队列
+            if depth < self.max_depth:
+                for link in self.get_links(normalized_url):
                     if link not in self.visited_urls:
-                        futures.append(executor.submit(self.crawl, link, depth + 1))
-                
-                for future in as_completed(futures):
-                    future.result()
+                        self._submit(link, depth + 1)
+        except Exception as e:
+            print(f"Error crawling {normalized_url}: {e}")
+        finally:
+            with self.pending_lock:
+                self.pending_tasks -= 1
+                if self.pending_tasks == 0:
+                    self.all_done.set()
     
     def start(self):
         """开始爬取"""
-        self.crawl(self.start_url)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self.executor = executor
+            self._submit(self.start_url, 1)
+            self.all_done.wait()
         print(f"\nCrawling completed. Total pages saved: {len(self.visited_urls)}")
 
 if __name__ == "__main__":
@@ -1,31 +1,79 @@
 import os
-import time
+import queue
 from urllib.parse import urljoin, urlparse, unquote, quote
 import requests
-from bs4 import BeautifulSoup
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from lxml import etree
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Event
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException, WebDriverException
 import base64
 
+# Windows文件名中不允许的字符，一次translate全部替换为下划线
+_INVALID_CHARS = r'<>:"/\|?*'
+_INVALID_CHARS_TABLE = str.maketrans({c: '_' for c in _INVALID_CHARS})
+# 查询参数额外将=和&替换为可读的标记
+_QUERY_CHARS_TABLE = str.maketrans({'=': '_eq_', '&': '_and_', **{c: '_' for c in _INVALID_CHARS}})
+
+def iter_hrefs(response):
+    """边下载边解析，逐个产出页面中<a>标签的href，已处理的节点随即释放
+    
+    按response.encoding增量解码后再交给解析器，无法解码的字节替换为U+FFFD，不会截断之后的内容
+    """
+    parser = etree.HTMLPullParser(events=('end',))
+    
+    def drain():
+        for _, element in parser.read_events():
+            if element.tag == 'a':
+                href = element.get('href')
+                if href:
+                    yield href
+            # 释放已解析完的节点，内存占用与页面大小无关
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+    
+    for chunk in response.iter_content(chunk_size=16384, decode_unicode=True):
+        parser.feed(chunk)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
 class WebsiteCrawler:
-    def __init__(self, start_url, max_depth=3, output_dir='pdf_output'):
+    def __init__(self, start_url, max_depth=3, output_dir='pdf_output', max_workers=5):
         # 初始化时解码start_url中的中文（如果有）
         self.start_url = self._normalize_url(start_url)
         self.max_depth = max_depth
         self.output_dir = output_dir
+        self.max_workers = max_workers
         self.visited_urls = set()
+        self.visited_lock = Lock()
+        
+        # 全局线程池及未完成任务计数，计数归零即表示爬取结束
+        self.executor = None
+        self.pending_tasks = 0
+        self.pending_lock = Lock()
+        self.all_done = Event()
+        
+        # 浏览器池：每个工作线程同一时刻独占一个Chrome实例，跨页面复用（None表示取用时再启动）
+        self.driver_pool = None
         self.domain = urlparse(self.start_url).netloc
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         })
+        # 连接池大小与线程数保持一致，避免并发时连接被丢弃重建
+        adapter = HTTPAdapter(pool_maxsize=self.max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
         
         os.makedirs(self.output_dir, exist_ok=True)
     
-    def _normalize_url(self, url):
-        """统一URL格式，处理中文编码问题"""
-        parsed = urlparse(url)
+    def _normalize_parsed(self, parsed):
+        """统一已解析URL的格式，处理中文编码问题"""
         # 解码路径和查询参数中的中文
         path = unquote(parsed.path)
         query = unquote(parsed.query)
@@ -35,76 +83,84 @@ class WebsiteCrawler:
         # 重构URL
         return parsed._replace(path=path, query=query).geturl()
     
-    def is_valid_url(self, url):
-        """检查URL是否有效且属于同一域名"""
+    def _normalize_url(self, url):
+        """统一URL格式，处理中文编码问题"""
+        return self._normalize_parsed(urlparse(url))
+    
+    def _parse_and_validate(self, url):
+        """解析URL，属于同一域名的http(s)链接返回标准化后的URL，否则返回None"""
         try:
-            parsed = urlparse(self._normalize_url(url))
-            return bool(parsed.netloc) and parsed.netloc == self.domain and parsed.scheme in ['http', 'https']
-        except:
-            return False
+            parsed = urlparse(url)
+        except ValueError:
+            return None
+        # 标准化不会改变协议和域名，先校验，站外链接无需再做编码处理
+        if not parsed.netloc or parsed.netloc != self.domain or parsed.scheme not in ('http', 'https'):
+            return None
+        return self._normalize_parsed(parsed)
     
-    def get_links(self, url):
-        """获取页面中的所有有效链接，正确处理中文"""
+    def get_links(self, normalized_url):
+        """获取页面中的所有有效链接（传入及返回的URL均已标准化）"""
         try:
-            normalized_url = self._normalize_url(url)
-            response = self.session.get(normalized_url, timeout=10)
-            response.raise_for_status()
-            
-            # 设置正确的编码（根据网页实际编码调整）
-            if response.encoding.lower() not in ('utf-8', 'gbk', 'gb2312'):
-                response.encoding = 'utf-8'
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
             links = set()
-            for a_tag in soup.find_all('a', href=True):
-                href = a_tag['href']
-                try:
-                    # 处理相对路径和绝对路径
-                    full_url = urljoin(normalized_url, href)
-                    # 标准化URL（处理中文）
-                    full_url = self._normalize_url(full_url)
-                    if self.is_valid_url(full_url):
-                        links.add(full_url)
-                except Exception as e:
-                    print(f"Error processing link {href}: {e}")
+            # 流式下载，解析与网络读取同时进行
+            with self.session.get(normalized_url, timeout=10, stream=True) as response:
+                response.raise_for_status()
+                
+                # 设置正确的编码（根据网页实际编码调整）
+                if response.encoding.lower() not in ('utf-8', 'gbk', 'gb2312'):
+                    response.encoding = 'utf-8'
+                
+                for href in iter_hrefs(response):
+                    try:
+                        # 处理相对路径和绝对路径，校验后标准化URL（处理中文）
+                        full_url = self._parse_and_validate(urljoin(normalized_url, href))
+                        if full_url:
+                            links.add(full_url)
+                    except Exception as e:
+                        print(f"Error processing link {href}: {e}")
             return links
         except Exception as e:
-            print(f"Error getting links from {url}: {e}")
+            print(f"Error getting links from {normalized_url}: {e}")
             return set()
     
+    def _create_driver(self):
+        """启动一个无头Chrome实例"""
+        chrome_options = Options()
+        chrome_options.add_argument('--headless')
+        chrome_options.add_argument('--disable-gpu')
+        chrome_options.add_argument('--no-sandbox')
+        return webdriver.Chrome(options=chrome_options)
+    
     def save_as_pdf(self, url):
         """使用 Selenium 和 Chrome 打印功能保存网页为 PDF"""
         try:
-            # 初始化 Chrome 选项
-            chrome_options = Options()
-            chrome_options.add_argument('--headless')
-            chrome_options.add_argument('--disable-gpu')
-            chrome_options.add_argument('--no-sandbox')
-            
             # 设置 PDF 保存路径
             parsed_url = urlparse(url)
             path = unquote(parsed_url.path).strip('/') or 'index'
-            filename = f"{parsed_url.netloc}_{path.replace('/', '_')}"
+            # 清理无效字符（路径中的/一并替换为_）
+            filename = f"{parsed_url.netloc}_{path}".translate(_INVALID_CHARS_TABLE)
             
             # 处理查询参数
             if parsed_url.query:
                 query = unquote(parsed_url.query)
-                filename += f"_{query.replace('&', '_and_').replace('=', '_eq_')}"
-            
-            # 清理无效字符
-            invalid_chars = r'<>:"/\|?*'
-            for char in invalid_chars:
-                filename = filename.replace(char, '_')
+                filename += f"_{query.translate(_QUERY_CHARS_TABLE)}"
             
             filename = filename[:200] + '.pdf'
             filepath = os.path.join(self.output_dir, filename)
             
-            # 启动浏览器
-            driver = webdriver.Chrome(options=chrome_options)
+            # 从浏览器池中取出一个Chrome实例
+            driver = self.driver_pool.get()
             try:
+                if driver is None:
+                    driver = self._create_driver()
                 driver.get(url)
-                time.sleep(2)  # 等待页面加载
+                # 等待页面加载完成，超时则按当前渲染结果打印
+                try:
+                    WebDriverWait(driver, 10).until(
+                        lambda d: d.execute_script('return document.readyState') == 'complete'
+                    )
+                except TimeoutException:
+                    pass
                 
                 # 打印参数设置
                 print_options = {
@@ -130,41 +186,70 @@ class WebsiteCrawler:
                 
                 print(f"Saved: {url} as {filepath}")
                 return True
+            except WebDriverException:
+                # 浏览器会话失效（如标签页崩溃）时关闭该实例，下次取用时重新启动
+                if driver is not None:
+                    try:
+                        driver.quit()
+                    except WebDriverException:
+                        pass
+                driver = None
+                raise
             finally:
-                driver.quit()
+                self.driver_pool.put(driver)
         except Exception as e:
             print(f"Error saving {url} as PDF: {str(e)}")
             return False
     
-    def crawl(self, url, depth=1):
-        """递归爬取网页，正确处理中文URL"""
-        normalized_url = self._normalize_url(url)
-        
-        if depth > self.max_depth or normalized_url in self.visited_urls:
-            return
-        
-        self.visited_urls.add(normalized_url)
-        print(f"Crawling: {normalized_url} (Depth: {depth})")
-        
-        # 保存当前页面为PDF
-        self.save_as_pdf(normalized_url)
-        
-        # 获取并处理子链接
-        if depth < self.max_depth:
-            links = self.get_links(normalized_url)
+    def _submit(self, url, depth):
+        """将页面提交到全局线程池"""
+        with self.pending_lock:
+            self.pending_tasks += 1
+        self.executor.submit(self.process_url, url, depth)
+    
+    def process_url(self, normalized_url, depth):
+        """爬取单个页面（URL已标准化），并将新发现的链接提交到线程池"""
+        try:
+            with self.visited_lock:
+                if depth > self.max_depth or normalized_url in self.visited_urls:
+                    return
+                self.visited_urls.add(normalized_url)
+            print(f"Crawling: {normalized_url} (Depth: {depth})")
+            
+            # 保存当前页面为PDF
+            self.save_as_pdf(normalized_url)
             
-            with ThreadPoolExecutor(max_workers=5) as executor:
-                futures = []
-                for link in links:
+            # 获取子链接并加入待爬取队列
+            if depth < self.max_depth:
+                for link in self.get_links(normalized_url):
                     if link not in self.visited_urls:
-                        futures.append(executor.submit(self.crawl, link, depth + 1))
-                
-                for future in as_completed(futures):
-                    future.result()
+                        self._submit(link, depth + 1)
+        except Exception as e:
+            print(f"Error crawling {normalized_url}: {e}")
+        finally:
+            with self.pending_lock:
+                self.pending_tasks -= 1
+                if self.pending_tasks == 0:
+                    self.all_done.set()
     
     def start(self):
         """开始爬取"""
-        self.crawl(self.start_url)
+        self.driver_pool = queue.Queue()
+        try:
+            # 预先启动与线程数相同的Chrome实例
+            for _ in range(self.max_workers):
+                self.driver_pool.put(self._create_driver())
+            
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                self.executor = executor
+                self._submit(self.start_url, 1)
+                self.all_done.wait()
+        finally:
+            # 爬取结束后统一关闭浏览器
+            while not self.driver_pool.empty():
+                driver = self.driver_pool.get()
+                if driver is not None:
+                    driver.quit()
         print(f"\nCrawling completed. Total pages saved: {len(self.visited_urls)}")
 
 if __name__ == "__main__":
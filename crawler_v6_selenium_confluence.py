@@ -1,18 +1,382 @@
 import os
+import re
+import math
 import time
-import random
-import base64
-from urllib.parse import urljoin, urlparse
-from selenium import webdriver
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-import requests
+import queue
+import hashlib
+import sqlite3
+import tempfile
+import asyncio
+import atexit
+import threading
+import multiprocessing
+from multiprocessing.managers import BaseManager
+from collections import Counter, OrderedDict, deque
+from urllib.parse import urljoin, urlparse, urlunparse, parse_qsl, urlencode
+from playwright.sync_api import sync_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
+import aiohttp
+from lxml import etree
 from bs4 import BeautifulSoup
 
+# 规范化URL时去掉的跟踪参数
+_TRACKING_PARAMS = {'gclid', 'fbclid', 'ref'}
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Windows文件名中不允许的字符，一次translate全部替换为下划线
+_INVALID_CHARS_TABLE = str.maketrans({c: '_' for c in r'<>:"/\|?*'})
+
+# 计算内容指纹前去掉的日期和数字（“最近更新”等宏每次渲染都不同）
+_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}:\d{2}(?::\d{2})?)?')
+_DIGITS_RE = re.compile(r'\d+')
+# 去掉日期和数字后文字少于此长度的页面（如只有图表、图片或附件）不做内容去重
+_MIN_SIG_CHARS = 20
+# 计算PDF内容哈希前去掉的生成时间（内容相同的页面每次打印的字节仅此不同）
+_PDF_DATE_RE = re.compile(rb'/(?:CreationDate|ModDate)\s*\(D:[^)]*\)')
+
+# 打印前隐藏无关元素
+_PRINT_CSS = """
+    .sidebar, .header, .footer { display: none !important; }
+    .main-content { margin: 0 !important; }
+"""
+
+# 在浏览器中读取内容区域的链接和文本（避免再单独下载一次页面），同时插入打印样式，一次调用完成
+_EXTRACT_JS = """(css) => {
+    const content = document.querySelector('#main-content, .content-container');
+    const result = content ? {
+        links: [...content.querySelectorAll('a[href]')].map(a => a.getAttribute('href')),
+        text: content.innerText
+    } : {links: [], text: ''};
+    const style = document.createElement('style');
+    style.textContent = css;
+    document.head.appendChild(style);
+    return result;
+}"""
+
+# 内容区域中指向Confluence页面的链接
+_CONTENT_LINKS_XPATH = etree.XPath(
+    '(//*[@id="main-content"] | //*[contains(concat(" ", normalize-space(@class), " "), " content-container ")])'
+    '//a[starts-with(@href, "/display/") or starts-with(@href, "/pages/")]/@href'
+)
+
+def digest128(text):
+    """计算字符串的128位哈希（整数），用作去重键"""
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest(), 'little')
+
+def pdf_digest(data):
+    """计算PDF内容的哈希（忽略生成时间），内容相同的PDF只需保存一份"""
+    return hashlib.blake2b(_PDF_DATE_RE.sub(b'', data), digest_size=16).hexdigest()
+
+def simhash64(tokens):
+    """计算词序列的64位SimHash指纹，内容相近的页面指纹的汉明距离也小"""
+    weights = [0] * 64
+    for token in tokens:
+        h = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+        for i in range(64):
+            weights[i] += 1 if h >> i & 1 else -1
+    return sum(1 << i for i, weight in enumerate(weights) if weight > 0)
+
+class SimHashIndex:
+    """SimHash指纹索引，查找汉明距离不超过max_distance的已有指纹
+    
+    指纹分成 max_distance+1 段，相近的指纹至少有一段完全相同，只需比较同段相同的候选
+    """
+    
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        self.num_blocks = max_distance + 1
+        self.block_bits = 64 // self.num_blocks
+        self.tables = [{} for _ in range(self.num_blocks)]
+        self.lock = threading.Lock()
+    
+    def _blocks(self, sig):
+        mask = (1 << self.block_bits) - 1
+        return [(sig >> (i * self.block_bits)) & mask for i in range(self.num_blocks)]
+    
+    def find_near(self, sig):
+        """返回一个相近的已有指纹，没有时返回None"""
+        for table, block in zip(self.tables, self._blocks(sig)):
+            for other in table.get(block, ()):
+                if (sig ^ other).bit_count() <= self.max_distance:
+                    return other
+        return None
+    
+    def add(self, sig):
+        for table, block in zip(self.tables, self._blocks(sig)):
+            table.setdefault(block, []).append(sig)
+    
+    def extend(self, sigs):
+        """批量添加指纹（恢复爬取状态时使用）"""
+        with self.lock:
+            for sig in sigs:
+                self.add(sig)
+    
+    def remove(self, sig):
+        """移除指纹（对应页面最终未能保存PDF时使用）"""
+        with self.lock:
+            for table, block in zip(self.tables, self._blocks(sig)):
+                candidates = table.get(block)
+                if candidates and sig in candidates:
+                    candidates.remove(sig)
+    
+    def add_if_new(self, sig):
+        """没有相近指纹时添加并返回True，否则返回False（多个进程共享时保证原子性）"""
+        with self.lock:
+            if self.find_near(sig) is not None:
+                return False
+            self.add(sig)
+            return True
+
+class PdfDigestIndex:
+    """已写入磁盘的PDF的内容哈希到文件路径的映射
+    
+    同时记录每个文件当前内容的哈希，文件将被其他内容覆盖时撤销原有的映射；
+    只有写入完成的文件才会登记，其他进程不会链接到尚未写完的文件
+    """
+    
+    def __init__(self):
+        self.paths = {}
+        self.digests = {}
+        self.lock = threading.Lock()
+    
+    def _drop(self, path):
+        digest = self.digests.pop(path, None)
+        if digest is not None and self.paths.get(digest) == path:
+            del self.paths[digest]
+    
+    def _place(self, path, digest):
+        self._drop(path)
+        self.digests[path] = digest
+        self.paths.setdefault(digest, path)
+    
+    def extend(self, items):
+        """批量添加 (文件路径, 哈希)（恢复爬取状态时使用）"""
+        with self.lock:
+            for path, digest in items:
+                self._place(path, digest)
+    
+    def claim(self, digest, path):
+        """准备将内容为digest的PDF放到path，返回内容相同、可供链接的已有文件路径，没有时返回None
+        
+        path原有内容的登记随即撤销，新内容在写入或链接完成后由add登记（多个进程共享时保证原子性）
+        """
+        with self.lock:
+            existing = self.paths.get(digest)
+            if existing != path:
+                self._drop(path)
+            return existing
+    
+    def add(self, path, digest):
+        """登记已写入或链接完成的文件"""
+        with self.lock:
+            self._place(path, digest)
+
+class IndexManager(BaseManager):
+    """在独立进程中托管指纹和PDF哈希索引，供所有PDF转换进程共享"""
+
+IndexManager.register('SimHashIndex', SimHashIndex)
+IndexManager.register('PdfDigestIndex', PdfDigestIndex)
+
+class BloomFilter:
+    """可扩展的布隆过滤器，用于海量URL去重（极小概率将新URL误判为已访问）"""
+    
+    def __init__(self, initial_capacity=100000, error_rate=1e-5):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.count = 0
+        # 每层为 [位数组, 位数, 哈希次数, 容量, 已添加数]
+        self.layers = []
+        self._add_layer()
+    
+    def _add_layer(self):
+        """容量用尽时追加新层：容量翻倍、误判率减半，总误判率不超过error_rate"""
+        n = len(self.layers)
+        capacity = self.initial_capacity * (2 ** n)
+        error_rate = self.error_rate * (0.5 ** (n + 1))
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        num_hashes = max(1, int(round(num_bits / capacity * math.log(2))))
+        self.layers.append([bytearray((num_bits + 7) // 8), num_bits, num_hashes, capacity, 0])
+    
+    @staticmethod
+    def _hash_pair(item):
+        """一次哈希得到两个64位值，按 h1 + i*h2 派生k个位置（Kirsch-Mitzenmacher）"""
+        digest = digest128(item)
+        return digest & 0xFFFFFFFFFFFFFFFF, (digest >> 64) | 1
+    
+    @staticmethod
+    def _in_layer(layer, h1, h2):
+        bits, num_bits, num_hashes = layer[0], layer[1], layer[2]
+        for i in range(num_hashes):
+            pos = (h1 + i * h2) % num_bits
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+    
+    def __contains__(self, item):
+        h1, h2 = self._hash_pair(item)
+        return any(self._in_layer(layer, h1, h2) for layer in self.layers)
+    
+    def __len__(self):
+        return self.count
+    
+    def add(self, item):
+        """添加元素；若元素（可能）已存在则返回False"""
+        h1, h2 = self._hash_pair(item)
+        if any(self._in_layer(layer, h1, h2) for layer in self.layers):
+            return False
+        
+        layer = self.layers[-1]
+        if layer[4] >= layer[3]:
+            self._add_layer()
+            layer = self.layers[-1]
+        
+        bits, num_bits, num_hashes = layer[0], layer[1], layer[2]
+        for i in range(num_hashes):
+            pos = (h1 + i * h2) % num_bits
+            bits[pos >> 3] |= 1 << (pos & 7)
+        layer[4] += 1
+        self.count += 1
+        return True
+
+class TokenBucket:
+    """按域名的令牌桶限速：每个域名平均每秒rate个请求，允许最多burst个请求的突发"""
+    
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        # 每个域名为 [剩余令牌数, 上次补充时间]，令牌为负表示已预约的后续请求
+        self.buckets = {}
+    
+    async def acquire(self, host):
+        """取得一个令牌，令牌不足时等待补充（只在事件循环线程中调用，无需加锁）"""
+        now = time.monotonic()
+        bucket = self.buckets.setdefault(host, [self.burst, now])
+        bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate) - 1
+        bucket[1] = now
+        if bucket[0] < 0:
+            await asyncio.sleep(-bucket[0] / self.rate)
+
+class CrawlState:
+    """用SQLite（WAL模式）持久化爬取状态，爬虫中断后重新启动时从断点继续
+    
+    pages表记录已发现的URL及深度，status为空表示尚未处理，'failed'的页面恢复时重新处理；fingerprints表记录已保存页面的内容指纹；
+    pdfs表记录输出目录中每个PDF文件当前内容的哈希
+    """
+    
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, depth INTEGER, status TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS fingerprints (sig INTEGER PRIMARY KEY)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS pdfs (path TEXT PRIMARY KEY, digest TEXT)")
+        self.conn.commit()
+    
+    def urls(self):
+        return [row[0] for row in self.conn.execute("SELECT url FROM pages")]
+    
+    def pending(self):
+        """返回尚未处理或处理失败的 (URL, 深度)，按发现顺序排列"""
+        return self.conn.execute(
+            "SELECT url, depth FROM pages WHERE status IS NULL OR status = 'failed' ORDER BY rowid"
+        ).fetchall()
+    
+    def fingerprints(self):
+        # SQLite整数为有符号64位，读写时与无符号指纹相互转换
+        return [row[0] & 0xFFFFFFFFFFFFFFFF for row in self.conn.execute("SELECT sig FROM fingerprints")]
+    
+    def pdf_files(self):
+        """返回已保存PDF的 (文件路径, 哈希)，跳过已被删除的文件"""
+        return [row for row in self.conn.execute("SELECT path, digest FROM pdfs") if os.path.exists(row[0])]
+    
+    def count(self, status):
+        return self.conn.execute("SELECT COUNT(*) FROM pages WHERE status = ?", (status,)).fetchone()[0]
+    
+    def add_pending(self, entries):
+        """记录新发现的 (URL, 深度)"""
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO pages VALUES (?, ?, NULL)", entries)
+    
+    def record(self, url, status, sig, pdf_file, entries):
+        """在同一事务中记录页面的处理结果、内容指纹、PDF哈希和页面中新发现的链接"""
+        with self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO pages VALUES (?, ?, NULL)", entries)
+            self.conn.execute("UPDATE pages SET status = ? WHERE url = ?", (status, url))
+            if sig is not None:
+                signed = sig - (1 << 64) if sig >= 1 << 63 else sig
+                self.conn.execute("INSERT OR IGNORE INTO fingerprints VALUES (?)", (signed,))
+            if pdf_file is not None:
+                self.conn.execute("INSERT OR REPLACE INTO pdfs (digest, path) VALUES (?, ?)", pdf_file)
+    
+    def close(self):
+        self.conn.close()
+
+def write_file(filepath, data):
+    """以无缓冲的系统调用写入临时文件，再替换到filepath
+    
+    filepath可能是与其他PDF共享数据的硬链接，替换而不是原地改写，其他文件不受影响
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath) or '.', suffix='.tmp')
+    try:
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def pdf_writer(write_queue, result_queue, archetypes, pdf_index):
+    """写入线程：PDF写入磁盘后登记其内容哈希并返回页面的处理结果，写入失败时撤销页面的内容指纹，收到None时退出"""
+    while (item := write_queue.get()) is not None:
+        write, (url, status, links, sig, pdf_file) = item
+        if write is not None:
+            try:
+                write_file(*write)
+                pdf_index.add(write[0], pdf_file[0])
+                print(f"已保存: {write[0]}")
+            except OSError as e:
+                print(f"PDF写入失败: {write[0]} - {str(e)}")
+                if sig is not None:
+                    archetypes.remove(sig)
+                status, sig, pdf_file = 'failed', None, None
+        result_queue.put((url, status, links, sig, pdf_file))
+
+def pdf_worker(crawler, url_queue, result_queue):
+    """PDF转换进程：使用自己的浏览器依次转换队列中的页面并返回页面中的链接，收到None时退出
+    
+    PDF交给本进程的写入线程保存，浏览器不必等待磁盘IO即可转换下一个页面
+    """
+    write_queue = queue.Queue(maxsize=4)
+    writer = threading.Thread(target=pdf_writer, args=(write_queue, result_queue, crawler.archetypes, crawler.pdf_index))
+    writer.start()
+    try:
+        while (url := url_queue.get()) is not None:
+            *result, write = crawler.save_as_pdf(url)
+            write_queue.put((write, (url, *result)))
+    finally:
+        write_queue.put(None)
+        writer.join()
+        crawler._shutdown()
+
 class ConfluenceCrawler:
-    def __init__(self, base_url, username, password, space_key, max_depth=3, output_dir="confluence_pdfs"):
+    # 同时交给PDF转换进程的最大页面数，限制结果等待期间的内存占用
+    BATCH_SIZE = 32
+    # 等待转换结果的超时时间（秒），超时后检查转换进程是否意外退出
+    RESULT_TIMEOUT = 5
+    # 打印参数（所有页面相同）
+    PDF_OPTIONS = {
+        'print_background': True,
+        'prefer_css_page_size': True,
+        'margin': {'top': '0.4in', 'bottom': '0.4in', 'left': '0.4in', 'right': '0.4in'}
+    }
+
+    def __init__(self, base_url, username, password, space_key, max_depth=3, output_dir="confluence_pdfs", concurrency=8, pdf_workers=None, state_file="crawl_state.db", fetch_rate=2.0, render_rate=1.0):
         """
         初始化爬虫
         :param base_url: Confluence 基础URL (如 "https://wiki.your-company.com")
@@ -21,31 +385,96 @@ class ConfluenceCrawler:
         :param space_key: 空间Key (如 "DEV")
         :param max_depth: 最大爬取深度
         :param output_dir: PDF输出目录
+        :param concurrency: 同时进行的页面请求数
+        :param pdf_workers: PDF转换进程数，每个进程使用独立的浏览器（默认按CPU核心数，最多4个）
+        :param state_file: 爬取状态文件名（保存在输出目录中），为None时不保存状态；删除该文件即可重新完整爬取
+        :param fetch_rate: 直接下载页面时每个域名每秒的请求数
+        :param render_rate: 每秒交给浏览器加载的页面数（浏览器还会加载页面资源，速率应低于fetch_rate）
         """
         self.base_url = base_url.rstrip('/')
         self.space_key = space_key
         self.max_depth = max_depth
         self.output_dir = output_dir
-        self.visited_urls = set()
-        self.session = requests.Session()
         
-        # 认证配置
-        self.session.auth = (username, password)  # Basic Auth
-        self.session.headers.update({
+        # 已访问URL（规范化后）用布隆过滤器去重，最近访问的URL另用小型LRU精确判断
+        self.seen = BloomFilter(initial_capacity=100_000, error_rate=1e-5)
+        self.recent = OrderedDict()
+        self.recent_size = 4096
+        
+        # 已保存页面的内容指纹，内容几乎相同的页面不再重复生成PDF
+        self.archetypes = SimHashIndex(max_distance=3)
+        # 已保存PDF的内容哈希，字节相同的PDF只保存一份，其余以硬链接指向它
+        self.pdf_index = PdfDigestIndex()
+        self.saved_count = 0
+        self.duplicate_count = 0
+        self.concurrency = concurrency
+        
+        # 认证配置（会话在事件循环中创建，整个爬取过程复用同一个连接池；浏览器使用相同的凭据）
+        self.credentials = {'username': username, 'password': password}
+        self.auth = aiohttp.BasicAuth(username, password)  # Basic Auth
+        self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Accept': 'text/html,application/xhtml+xml'
-        })
+            'Accept': 'text/html,application/xhtml+xml',
+            'Accept-Encoding': 'gzip, deflate'
+        }
+        self.session = None
+        self.semaphore = None
+        
+        # 请求限速（总体速率受限，各请求之间不互相阻塞）
+        self.fetch_limiter = TokenBucket(fetch_rate)
+        self.render_limiter = TokenBucket(render_rate)
+        
+        # PDF转换进程，每项为 (进程, 该进程的任务队列)，与结果队列一起在start中创建
+        self.pdf_workers = pdf_workers or min(4, multiprocessing.cpu_count())
+        self.workers = []
+        self.result_queue = None
+        
+        # 持久化的爬取状态（在start中打开，不随爬虫对象传给转换进程）
+        self.state_file = state_file
+        self.state = None
         
         # 创建输出目录
         os.makedirs(self.output_dir, exist_ok=True)
         
-        # Selenium 配置
-        self.chrome_options = Options()
-        self.chrome_options.add_argument('--headless')
-        self.chrome_options.add_argument('--disable-gpu')
-        self.chrome_options.add_argument('--no-sandbox')
-        self.chrome_options.add_argument('--disable-dev-shm-usage')
-        self.chrome_options.add_argument('--disable-blink-features=AutomationControlled')
+        # Chromium 启动参数
+        self.browser_args = [
+            '--disable-gpu',
+            '--no-sandbox',
+            '--disable-dev-shm-usage',
+            '--disable-blink-features=AutomationControlled'
+        ]
+        
+        # 所有页面复用同一个浏览器，每个页面使用独立的上下文，仅在浏览器崩溃时重建
+        self._playwright = None
+        self._browser = None
+        atexit.register(self._shutdown)
+
+    def __getstate__(self):
+        """传给转换进程时去掉只在主进程中使用的对象"""
+        state = self.__dict__.copy()
+        for key in ('state', 'session', 'semaphore', 'workers', 'result_queue'):
+            state[key] = None
+        return state
+
+    def _get_browser(self):
+        """获取浏览器实例，首次使用时启动Chromium"""
+        if self._browser is None or not self._browser.is_connected():
+            self._shutdown()
+            self._playwright = sync_playwright().start()
+            self._browser = self._playwright.chromium.launch(headless=True, args=self.browser_args)
+        return self._browser
+
+    def _shutdown(self):
+        """关闭浏览器"""
+        if self._browser is not None:
+            try:
+                self._browser.close()
+            except PlaywrightError:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            self._playwright.stop()
+            self._playwright = None
 
     def _normalize_url(self, url):
         """标准化URL（处理相对路径和锚点）"""
@@ -53,6 +482,32 @@ class ConfluenceCrawler:
             return urljoin(self.base_url, url)
         return url
 
+    def _canonicalize(self, url):
+        """规范化URL：主机名小写、去掉默认端口、锚点、跟踪参数和末尾斜杠，查询参数排序"""
+        parsed = urlparse(url)
+        scheme = parsed.scheme.lower()
+        netloc = parsed.hostname or ''
+        if parsed.port and parsed.port != _DEFAULT_PORTS.get(scheme):
+            netloc = f"{netloc}:{parsed.port}"
+        
+        path = parsed.path.rstrip('/') or '/'
+        query = urlencode(sorted(
+            (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+            if not key.startswith('utm_') and key not in _TRACKING_PARAMS
+        ))
+        return urlunparse((scheme, netloc, path, parsed.params, query, ''))
+
+    def _mark_seen(self, url):
+        """记录已访问的URL；若URL已访问过则返回False"""
+        if url in self.recent:
+            self.recent.move_to_end(url)
+            return False
+        
+        self.recent[url] = None
+        if len(self.recent) > self.recent_size:
+            self.recent.popitem(last=False)
+        return self.seen.add(url)
+
     def _get_pdf_filename(self, url):
         """生成PDF文件名"""
         parsed = urlparse(url)
@@ -60,103 +515,348 @@ class ConfluenceCrawler:
         filename = f"{parsed.netloc}_{'_'.join(path_parts[-2:])}.pdf"
         
         # 清理无效字符
-        invalid_chars = r'<>:"/\|?*'
-        for char in invalid_chars:
-            filename = filename.replace(char, '_')
-        return filename[:200]  # 限制长度
+        return filename.translate(_INVALID_CHARS_TABLE)[:200]  # 限制长度
 
     def save_as_pdf(self, url):
-        """使用Selenium保存页面为PDF"""
+        """使用Playwright保存页面为PDF
+        
+        返回 (结果, 页面中的有效链接, 内容指纹, (PDF哈希, 文件路径), (文件路径, 待写入的PDF))，
+        结果为 'saved'、'duplicate' 或 'failed'；页面加载失败时链接为None，未生成新指纹、
+        未写入或链接PDF文件时对应项为None
+        """
         filename = self._get_pdf_filename(url)
         filepath = os.path.join(self.output_dir, filename)
         
-        driver = webdriver.Chrome(options=self.chrome_options)
+        print(f"正在转换: {url}")
+        
+        # 浏览器崩溃时重建浏览器并重试一次
+        for attempt in range(2):
+            try:
+                return self._render_pdf(url, filepath)
+            except PlaywrightTimeoutError:
+                print(f"PDF转换失败: {url} - 等待页面内容超时")
+                return 'failed', None, None, None, None
+            except PlaywrightError as e:
+                if attempt or (self._browser is not None and self._browser.is_connected()):
+                    print(f"PDF转换失败: {url} - {str(e)}")
+                    return 'failed', None, None, None, None
+            except Exception as e:
+                print(f"PDF转换失败: {url} - {str(e)}")
+                return 'failed', None, None, None, None
+
+    def _render_pdf(self, url, filepath):
+        """在共享浏览器的新上下文中打开页面，提取链接后打印为PDF"""
+        # 每个页面使用独立的上下文（Cookie等互不影响），创建开销远小于启动浏览器
+        context = self._get_browser().new_context(
+            http_credentials=self.credentials,
+            user_agent=self.headers['User-Agent']
+        )
         try:
-            print(f"正在转换: {url}")
-            driver.get(url)
+            page = context.new_page()
+            page.goto(url)
             
             # 等待主要内容加载完成
-            WebDriverWait(driver, 10).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, '.main-content'))
-            )
-            # 隐藏无关元素
-            driver.execute_script("""
-                document.querySelectorAll('.sidebar, .header, .footer').forEach(el => el.style.display = 'none');
-                document.querySelector('.main-content').style.margin = '0';
-            """)
+            page.wait_for_selector('.main-content', timeout=10000)
+            
+            # 直接从已加载的页面中提取链接和内容文本，并隐藏无关元素
+            content = page.evaluate(_EXTRACT_JS, _PRINT_CSS)
+            links = self._filter_links(content['links'])
             
-            # 打印参数
-            print_params = {
-                'landscape': False,
-                'displayHeaderFooter': False,
-                'printBackground': True,
-                'preferCSSPageSize': True,
-                'margin': {'top': '0.4in', 'bottom': '0.4in', 'left': '0.4in', 'right': '0.4in'}
-            }
+            # 内容与已保存的页面几乎相同时跳过PDF转换
+            sig = self._content_sig(content['text'])
+            if sig is not None and not self.archetypes.add_if_new(sig):
+                print(f"内容重复，跳过PDF: {url}")
+                return 'duplicate', links, None, None, None
             
-            # 生成PDF
-            pdf_data = driver.execute_cdp_cmd('Page.printToPDF', print_params)
-            with open(filepath, 'wb') as f:
-                f.write(base64.b64decode(pdf_data['data']))
+            # 生成PDF；失败时撤销指纹，以免之后内容相近的页面因此被跳过
+            try:
+                pdf_data = page.pdf(**self.PDF_OPTIONS)
+            except Exception:
+                if sig is not None:
+                    self.archetypes.remove(sig)
+                raise
             
-            print(f"已保存: {filepath}")
+            # PDF与已保存的文件字节相同时只建立硬链接
+            digest = pdf_digest(pdf_data)
+            existing = self.pdf_index.claim(digest, filepath)
+            if existing is not None and self._link_pdf(existing, filepath):
+                self.pdf_index.add(filepath, digest)
+                print(f"PDF与已保存的文件相同，已链接: {filepath} -> {existing}")
+                return 'duplicate', links, sig, (digest, filepath), None
+            
+            # 由调用方写入磁盘，写入完成后才登记，供其他页面链接
+            return 'saved', links, sig, (digest, filepath), (filepath, pdf_data)
+        finally:
+            try:
+                context.close()
+            except PlaywrightError:
+                pass
+
+    def _link_pdf(self, existing, filepath):
+        """将filepath硬链接到内容相同的已有PDF，不额外占用磁盘空间；无法链接时返回False
+        
+        先在临时路径建立链接再替换到filepath，不改动filepath原来指向的文件数据
+        """
+        if existing == filepath:
             return True
-        except Exception as e:
-            print(f"PDF转换失败: {url} - {str(e)}")
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        try:
+            os.link(existing, tmp_path)
+            os.replace(tmp_path, filepath)
+            return True
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
             return False
-        finally:
-            driver.quit()
 
-    def get_page_links(self, url):
-        """获取页面中的所有有效链接"""
+    async def _fetch(self, url):
+        """异步下载页面，边接收边交给lxml解析（由解析器识别编码）
+        
+        返回 (文档根节点, 原始字节)，lxml无法解析时根节点为None
+        """
+        # 按域名限速防止被封
+        await self.fetch_limiter.acquire(urlparse(url).hostname)
+        
+        parser = etree.HTMLParser()
+        chunks = []
+        async with self.semaphore:
+            async with self.session.get(url) as response:
+                response.raise_for_status()
+                async for chunk in response.content.iter_chunked(16384):
+                    parser.feed(chunk)
+                    chunks.append(chunk)
+        
         try:
-            # 随机延迟防止被封
-            time.sleep(random.uniform(1, 3))
-            
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
+            root = parser.close()
+        except etree.XMLSyntaxError:
+            root = None
+        return root, b''.join(chunks)
+
+    def _filter_links(self, hrefs):
+        """保留指向Confluence页面的链接并规范化"""
+        return {
+            self._canonicalize(self._normalize_url(href))
+            for href in hrefs if href.startswith(('/display/', '/pages/'))
+        }
+
+    def _content_sig(self, text):
+        """计算内容区域文本的SimHash指纹（忽略日期和数字）；文字过少时返回None，不做内容去重"""
+        tokens = _DIGITS_RE.sub(' ', _DATE_RE.sub(' ', text)).lower().split()
+        if sum(map(len, tokens)) < _MIN_SIG_CHARS:
+            return None
+        return simhash64(tokens)
+
+    async def get_page_links(self, url):
+        """下载页面并提取内容区域中的有效链接（浏览器未能加载页面时使用）"""
+        try:
+            root, html = await self._fetch(url)
+            if root is not None:
+                # 只提取内容区域的链接
+                return self._filter_links(_CONTENT_LINKS_XPATH(root))
             
-            # 只提取内容区域的链接
-            links = set()
+            # lxml解析失败时退回html.parser
+            soup = BeautifulSoup(html, 'html.parser')
             main_content = soup.select_one('#main-content, .content-container')
             if not main_content:
                 return set()
-                
-            for a in main_content.find_all('a', href=True):
-                href = a['href']
-                if href.startswith(('/display/', '/pages/')):
-                    full_url = self._normalize_url(href)
-                    if full_url not in self.visited_urls:
-                        links.add(full_url)
-            return links
+            return self._filter_links(a['href'] for a in main_content.find_all('a', href=True))
         except Exception as e:
             print(f"链接提取失败: {url} - {str(e)}")
             return set()
 
-    def crawl(self, url, current_depth=1):
-        """递归爬取页面"""
-        if current_depth > self.max_depth or url in self.visited_urls:
-            return
+    def _restore_state(self):
+        """从持久化状态恢复已访问URL、内容指纹和计数，返回上次未处理完的 (URL, 深度)"""
+        for url in self.state.urls():
+            self.seen.add(url)
+        self.archetypes.extend(self.state.fingerprints())
+        self.pdf_index.extend(self.state.pdf_files())
+        self.saved_count = self.state.count('saved')
+        self.duplicate_count = self.state.count('duplicate')
+        return self.state.pending()
+
+    async def crawl(self, start_url):
+        """使用队列广度优先爬取页面"""
+        frontier = deque()
+        if self.state:
+            frontier.extend(self._restore_state())
+            if frontier:
+                print(f"从上次中断处继续，待爬取 {len(frontier)} 个页面")
         
-        self.visited_urls.add(url)
-        print(f"\n深度 {current_depth}: 爬取 {url}")
+        start_url = self._canonicalize(start_url)
+        if self._mark_seen(start_url):
+            frontier.append((start_url, 1))
+            if self.state:
+                self.state.add_pending([(start_url, 1)])
+        # 已交给转换进程的页面：URL -> (深度, 转换进程序号)
+        in_flight = {}
+        # 浏览器未能加载、改为直接下载提取链接的页面任务，与转换结果同时等待，互不阻塞
+        fetches = set()
+        # 等待转换结果的任务，超时前一直保留，不会重复读取结果队列
+        get_task = None
         
-        # 保存当前页为PDF
-        self.save_as_pdf(url)
+        while frontier or in_flight or fetches:
+            # 交给PDF转换进程，页面只在浏览器中加载一次，同时得到PDF和链接
+            while frontier and len(in_flight) + len(fetches) < self.BATCH_SIZE:
+                url, depth = frontier.popleft()
+                await self.render_limiter.acquire(urlparse(url).hostname)
+                print(f"\n深度 {depth}: 爬取 {url}")
+                # 交给未完成页面最少的转换进程
+                loads = Counter(index for _, index in in_flight.values())
+                index = min(range(len(self.workers)), key=loads.__getitem__)
+                in_flight[url] = (depth, index)
+                self.workers[index][1].put(url)
+            
+            waiting = set(fetches)
+            if in_flight:
+                if get_task is None:
+                    get_task = asyncio.create_task(
+                        asyncio.to_thread(self.result_queue.get, timeout=self.RESULT_TIMEOUT)
+                    )
+                waiting.add(get_task)
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+            
+            for task in done & fetches:
+                fetches.discard(task)
+                frontier.extend(task.result())
+            
+            if get_task not in done:
+                continue
+            task, get_task = get_task, None
+            try:
+                url, status, links, sig, pdf_file = task.result()
+            except queue.Empty:
+                for url, depth in self._recover_workers(in_flight):
+                    frontier.extend(self._handle_result(fetches, url, depth, 'failed', None, None, None))
+                continue
+            
+            if url not in in_flight:
+                # 转换进程退出前送出的结果，该页面已按转换失败处理
+                continue
+            depth, _ = in_flight.pop(url)
+            frontier.extend(self._handle_result(fetches, url, depth, status, links, sig, pdf_file))
+
+    def _recover_workers(self, in_flight):
+        """重启意外退出（如被系统杀死）的转换进程，返回其未完成页面的 (URL, 深度)"""
+        lost = []
+        for index, (process, _) in enumerate(self.workers):
+            if process.is_alive():
+                continue
+            print(f"PDF转换进程意外退出 (exitcode={process.exitcode})，重新启动")
+            self._start_worker(index)
+            for url, (depth, worker) in list(in_flight.items()):
+                if worker == index:
+                    print(f"PDF转换失败: {url} - 转换进程意外退出")
+                    del in_flight[url]
+                    lost.append((url, depth))
+        return lost
+
+    def _handle_result(self, fetches, url, depth, status, links, sig, pdf_file):
+        """处理转换结果，返回页面中新发现的 (链接, 深度)
         
-        # 获取并处理子链接
-        if current_depth < self.max_depth:
-            child_links = self.get_page_links(url)
-            for link in child_links:
-                self.crawl(link, current_depth + 1)
+        浏览器未能加载的页面改为后台直接下载提取链接，任务加入fetches，完成后由任务返回新链接
+        """
+        if links is None and depth < self.max_depth:
+            fetches.add(asyncio.create_task(self._fetch_and_record(url, depth, status, sig, pdf_file)))
+            return []
+        return self._record_result(url, depth, status, links, sig, pdf_file)
+
+    async def _fetch_and_record(self, url, depth, status, sig, pdf_file):
+        """直接下载页面提取链接，然后记录页面的处理结果"""
+        links = await self.get_page_links(url)
+        return self._record_result(url, depth, status, links, sig, pdf_file)
+
+    def _record_result(self, url, depth, status, links, sig, pdf_file):
+        """记录页面的处理结果，返回页面中新发现的 (链接, 深度)"""
+        if status == 'saved':
+            self.saved_count += 1
+        elif status == 'duplicate':
+            self.duplicate_count += 1
+        
+        new_links = []
+        if links and depth < self.max_depth:
+            new_links = [(link, depth + 1) for link in links if self._mark_seen(link)]
+        
+        if self.state:
+            self.state.record(url, status, sig, pdf_file, new_links)
+        return new_links
+
+    async def _run(self, start_url):
+        """创建共享会话并执行爬取"""
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        # 空闲连接保持较长时间，限速等待和等待PDF转换期间不会被关闭，避免重复TLS握手
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.concurrency,
+            keepalive_timeout=60,
+            ttl_dns_cache=300
+        )
+        async with aiohttp.ClientSession(
+            auth=self.auth,
+            headers=self.headers,
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=10)
+        ) as session:
+            self.session = session
+            await self.crawl(start_url)
+
+    def _start_worker(self, index):
+        """启动（或替换）第index个PDF转换进程；每个进程使用独立的任务队列，进程退出时可找回其未完成的页面"""
+        url_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=pdf_worker, args=(self, url_queue, self.result_queue))
+        process.start()
+        self.workers[index] = (process, url_queue)
+
+    def _stop_workers(self):
+        """通知转换进程退出，并等待剩余PDF转换完成"""
+        workers = [worker for worker in self.workers if worker is not None]
+        for _, url_queue in workers:
+            url_queue.put(None)
+        
+        # 等待期间持续取走结果，进程向未读完的队列写入数据时无法退出
+        while any(process.is_alive() for process, _ in workers):
+            try:
+                self.result_queue.get(timeout=0.5)
+            except queue.Empty:
+                pass
+        for process, _ in workers:
+            process.join()
+        self.workers = []
 
     def start(self):
         """启动爬虫"""
         start_url = f"{self.base_url}/display/{self.space_key}"
         print(f"开始爬取空间: {self.space_key} (起始URL: {start_url})")
-        self.crawl(start_url)
-        print(f"\n爬取完成! 共保存 {len(self.visited_urls)} 个PDF文件到 {self.output_dir}")
+        
+        # 内容指纹和PDF哈希索引由管理进程托管，所有转换进程共享
+        manager = IndexManager()
+        manager.start()
+        self.archetypes = manager.SimHashIndex(max_distance=3)
+        self.pdf_index = manager.PdfDigestIndex()
+        
+        self.result_queue = multiprocessing.Queue()
+        self.workers = [None] * self.pdf_workers
+        
+        try:
+            # 先打开爬取状态，打开失败时不必再启动转换进程
+            if self.state_file:
+                self.state = CrawlState(os.path.join(self.output_dir, self.state_file))
+            
+            # 启动PDF转换进程（Playwright同步接口不能跨线程/进程共享，每个进程各自持有一个浏览器）
+            for index in range(self.pdf_workers):
+                self._start_worker(index)
+            
+            asyncio.run(self._run(start_url))
+        finally:
+            self._stop_workers()
+            self.result_queue = None
+            manager.shutdown()
+            self._shutdown()
+            if self.state:
+                self.state.close()
+                self.state = None
+        print(f"\n爬取完成! 共保存 {self.saved_count} 个PDF文件到 {self.output_dir}"
+              f"（跳过 {self.duplicate_count} 个重复页面）")
 
 if __name__ == "__main__":
     # 配置参数